@@ -1,4 +1,9 @@
 from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
 from .models import (
     Localidad,
     PerfilUsuario,
@@ -9,11 +14,35 @@ from .models import (
     Valoracion
 )
 
+# A partir de este número de filas estimadas se deja de hacer COUNT(*) en los listados sin filtrar
+UMBRAL_CONTEO_ESTIMADO = 100000
+
+class PaginadorConteoEstimado(Paginator):
+    # En PostgreSQL usa la estimación del planificador (pg_class.reltuples) si no hay filtros ni búsqueda
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [self.object_list.model._meta.db_table],
+                )
+                fila = cursor.fetchone()
+            if fila and fila[0] >= UMBRAL_CONTEO_ESTIMADO:
+                return int(fila[0])
+        return super().count
+
+class AdminTablaGrande(admin.ModelAdmin):
+    # Opciones comunes para los modelos con muchas filas
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False # Evita el segundo COUNT(*) sin filtros al buscar/filtrar
+    show_facets = admin.ShowFacets.NEVER # Los conteos por filtro hacen un COUNT por cada opción
+    change_list_template = 'admin/change_list_indexado.html' # date_hierarchy sin DISTINCT sobre toda la tabla
+
 # Registros básicos
 admin.site.register(Localidad)
 admin.site.register(CategoriaObjeto)
-admin.site.register(FotoObjeto) # Puede que quieras un inline para Objeto más adelante
-admin.site.register(Valoracion)
 
 # Personalizaciones (opcional, pero recomendado para mejor usabilidad)
 
@@ -28,17 +57,50 @@ class FotoObjetoInline(admin.TabularInline): # o admin.StackedInline
     extra = 1 # Número de formularios extra para fotos
 
 @admin.register(Objeto)
-class ObjetoAdmin(admin.ModelAdmin):
+class ObjetoAdmin(AdminTablaGrande):
     list_display = ('nombre', 'propietario', 'categoria', 'localidad_actual', 'disponible_para', 'activo', 'fecha_publicacion')
-    search_fields = ('nombre', 'descripcion', 'propietario__username')
+    list_select_related = ('propietario', 'categoria', 'localidad_actual')
+    search_fields = ('^nombre', '=propietario__username') # Ver get_search_results
     list_filter = ('activo', 'disponible_para', 'categoria', 'localidad_actual', 'fecha_publicacion')
     date_hierarchy = 'fecha_publicacion'
+    raw_id_fields = ('propietario',)
     inlines = [FotoObjetoInline] # Para añadir/editar fotos directamente desde el objeto
 
+    def get_search_results(self, request, queryset, search_term):
+        # Prefijo del nombre (índice objeto_nombre_upper_idx) o nombre de usuario exacto (índice único de auth_user)
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        propietarios = User.objects.filter(username=search_term).values('pk')
+        return queryset.filter(Q(nombre__istartswith=search_term) | Q(propietario__in=propietarios)), False
+
 @admin.register(SolicitudTransaccion)
-class SolicitudTransaccionAdmin(admin.ModelAdmin):
+class SolicitudTransaccionAdmin(AdminTablaGrande):
     list_display = ('objeto', 'solicitante', 'tipo_transaccion', 'estado', 'fecha_solicitud')
-    search_fields = ('objeto__nombre', 'solicitante__username')
+    list_select_related = ('objeto__propietario', 'solicitante')
+    search_fields = ('^objeto__nombre', '=solicitante__username') # Ver get_search_results
     list_filter = ('tipo_transaccion', 'estado', 'fecha_solicitud')
     date_hierarchy = 'fecha_solicitud'
-    # Podrías añadir campos readonly o personalizar el form si es necesario
\ No newline at end of file
+    raw_id_fields = ('objeto', 'solicitante', 'objeto_ofrecido_intercambio')
+    # Podrías añadir campos readonly o personalizar el form si es necesario
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        objetos = Objeto.objects.filter(nombre__istartswith=search_term).values('pk')
+        solicitantes = User.objects.filter(username=search_term).values('pk')
+        return queryset.filter(Q(objeto__in=objetos) | Q(solicitante__in=solicitantes)), False
+
+@admin.register(FotoObjeto)
+class FotoObjetoAdmin(AdminTablaGrande):
+    list_display = ('__str__', 'fecha_subida')
+    list_select_related = ('objeto',)
+    raw_id_fields = ('objeto',)
+
+@admin.register(Valoracion)
+class ValoracionAdmin(AdminTablaGrande):
+    list_display = ('__str__', 'puntuacion', 'fecha_valoracion')
+    list_select_related = ('usuario_que_valora', 'usuario_valorado')
+    list_filter = ('puntuacion',)
+    raw_id_fields = ('solicitud', 'solicitud_archivada', 'usuario_que_valora', 'usuario_valorado')
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class MiAplicacionDjangoConfig(AppConfig): # Puedes mantener este nombre de clase si quieres
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'aplicacion' # CORREGIDO
\ No newline at end of file
+    name = 'aplicacion' # CORREGIDO
+
+    def ready(self):
+        from . import signals  # noqa: F401 Registra los receptores de señales
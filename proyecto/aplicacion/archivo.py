@@ -0,0 +1,78 @@
+import datetime
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import contadores
+from .models import SolicitudTransaccion, SolicitudTransaccionArchivada, Valoracion
+
+DIAS_ARCHIVO = getattr(settings, 'SOLICITUDES_ARCHIVO_DIAS', 180)
+TAMANO_LOTE = 500
+
+
+def fecha_limite(dias=DIAS_ARCHIVO):
+    return timezone.now() - datetime.timedelta(days=dias)
+
+
+def candidatas(limite):
+    # fecha_solicitud nunca es posterior a la de cierre, así que su índice acota la búsqueda
+    return (
+        SolicitudTransaccion.objects.filter(
+            estado__in=SolicitudTransaccion.ESTADOS_FINALES,
+            fecha_solicitud__lt=limite,
+        )
+        .annotate(fecha_cierre=Coalesce('fecha_fin_real', 'fecha_aceptacion_rechazo', 'fecha_solicitud'))
+        .filter(fecha_cierre__lt=limite)
+    )
+
+
+def archivar_lote(limite, tamano=TAMANO_LOTE):
+    """
+    Mueve un lote de solicitudes finalizadas a la tabla de archivo en una transacción corta.
+    Las filas bloqueadas por otra transacción se saltan y se archivarán en otra pasada.
+    Devuelve el número de solicitudes archivadas.
+    """
+    campos = [f.attname for f in SolicitudTransaccionArchivada._meta.concrete_fields]
+    with transaction.atomic():
+        ids = list(
+            candidatas(limite)
+            .order_by('id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:tamano]
+        )
+        if not ids:
+            return 0
+        solicitudes = list(
+            SolicitudTransaccion.objects.filter(id__in=ids).annotate(propietario_id=F('objeto__propietario_id'))
+        )
+        SolicitudTransaccionArchivada.objects.bulk_create([
+            SolicitudTransaccionArchivada(**{campo: getattr(solicitud, campo) for campo in campos})
+            for solicitud in solicitudes
+        ])
+        deltas = _deltas_contadores(solicitudes)
+        # Las valoraciones se quedan en su tabla y pasan a apuntar a la copia archivada
+        Valoracion.objects.filter(solicitud_id__in=ids).update(solicitud_archivada_id=F('solicitud_id'), solicitud=None)
+        with contadores.en_bloque():
+            SolicitudTransaccion.objects.filter(id__in=ids).delete()
+        contadores.aplicar(deltas)
+    return len(ids)
+
+
+def _deltas_contadores(solicitudes):
+    # Las archivadas dejan de contar en el resumen: se resta su contribución con una sola consulta de valoraciones
+    valoradas = defaultdict(set)
+    completadas = [s.id for s in solicitudes if s.estado == SolicitudTransaccion.EstadoSolicitud.COMPLETADA]
+    for solicitud_id, user_id in Valoracion.objects.filter(solicitud_id__in=completadas).values_list(
+        'solicitud_id', 'usuario_que_valora_id'
+    ):
+        valoradas[solicitud_id].add(user_id)
+    deltas = Counter()
+    for s in solicitudes:
+        deltas.subtract(contadores.contribucion_solicitud(
+            s.id, s.estado, s.solicitante_id, s.propietario_id, ya_valoraron=valoradas[s.id]
+        ))
+    return deltas
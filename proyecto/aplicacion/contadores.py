@@ -0,0 +1,158 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Count, Exists, F, OuterRef, Q
+
+from .models import ContadoresUsuario, Objeto, SolicitudTransaccion, Valoracion
+
+CAMPOS = ('objetos_publicados', 'solicitudes_recibidas_pendientes', 'prestamos_activos', 'valoraciones_pendientes')
+Estado = SolicitudTransaccion.EstadoSolicitud
+
+# Las funciones contribucion_* devuelven cuánto suma una fila a los contadores de cada usuario,
+# como Counter {(user_id, campo): n}. Al guardar se aplica la diferencia entre el estado nuevo
+# y el anterior; al borrar se resta la contribución.
+
+# Activo mientras un proceso por lotes aplica él mismo los deltas (ver archivo.archivar_lote)
+_en_bloque = ContextVar('contadores_en_bloque', default=False)
+
+
+@contextmanager
+def en_bloque():
+    # Los receptores por fila de signals.py no hacen nada dentro de este bloque
+    token = _en_bloque.set(True)
+    try:
+        yield
+    finally:
+        _en_bloque.reset(token)
+
+
+def por_fila():
+    return not _en_bloque.get()
+
+
+def contribucion_objeto(activo, propietario_id):
+    return Counter({(propietario_id, 'objetos_publicados'): 1}) if activo else Counter()
+
+
+def contribucion_solicitud(solicitud_id, estado, solicitante_id, propietario_id, ya_valoraron=None):
+    contribucion = Counter()
+    participantes = {solicitante_id, propietario_id}
+    if estado == Estado.PENDIENTE:
+        contribucion[(propietario_id, 'solicitudes_recibidas_pendientes')] += 1
+    elif estado == Estado.EN_CURSO:
+        for user_id in participantes:
+            contribucion[(user_id, 'prestamos_activos')] += 1
+    elif estado == Estado.COMPLETADA:
+        if ya_valoraron is None:
+            # Las valoraciones pueden apuntar ya a la copia archivada (ver archivo.py)
+            ya_valoraron = set(
+                Valoracion.objects.filter(Q(solicitud_id=solicitud_id) | Q(solicitud_archivada_id=solicitud_id))
+                .values_list('usuario_que_valora_id', flat=True)
+            )
+        for user_id in participantes - ya_valoraron:
+            contribucion[(user_id, 'valoraciones_pendientes')] += 1
+    return contribucion
+
+
+def contribucion_valoracion(valoracion_id, solicitud_id, usuario_que_valora_id):
+    # Resta un pendiente solo si es la única valoración del usuario sobre una solicitud activa y completada
+    if solicitud_id is None:
+        return Counter()
+    # Se bloquea la solicitud, como en el pre_save de SolicitudTransaccion: si a la vez otra transacción
+    # la completa, una de las dos espera y ve el estado o la valoración de la otra
+    estado = SolicitudTransaccion.objects.select_for_update().filter(pk=solicitud_id).values_list('estado', flat=True).first()
+    if estado != Estado.COMPLETADA:
+        return Counter()
+    otras = Valoracion.objects.filter(
+        solicitud_id=solicitud_id, usuario_que_valora_id=usuario_que_valora_id
+    ).exclude(pk=valoracion_id).exists()
+    if not otras:
+        return Counter({(usuario_que_valora_id, 'valoraciones_pendientes'): -1})
+    return Counter()
+
+
+def aplicar(deltas):
+    por_usuario = {}
+    for (user_id, campo), delta in deltas.items():
+        if delta:
+            por_usuario.setdefault(user_id, {})[campo] = F(campo) + delta
+    # Si el usuario aún no tiene fila no hay nada que actualizar: se calcula entera al pedir el resumen
+    for user_id, cambios in por_usuario.items():
+        ContadoresUsuario.objects.filter(user_id=user_id).update(**cambios)
+
+
+def calcular(user_ids):
+    """
+    Calcula desde cero los contadores de los usuarios indicados con una consulta agrupada por campo.
+    Devuelve {user_id: {campo: valor}}.
+    """
+    valores = {user_id: dict.fromkeys(CAMPOS, 0) for user_id in user_ids}
+    ids = list(valores)
+
+    def sumar(campo, queryset, columna):
+        for user_id, n in queryset.values_list(columna).annotate(n=Count('id')).order_by():
+            valores[user_id][campo] += n
+
+    solicitudes = SolicitudTransaccion.objects.all()
+    sumar('objetos_publicados', Objeto.objects.filter(activo=True, propietario_id__in=ids), 'propietario_id')
+    sumar(
+        'solicitudes_recibidas_pendientes',
+        solicitudes.filter(estado=Estado.PENDIENTE, objeto__propietario_id__in=ids),
+        'objeto__propietario_id',
+    )
+    en_curso = solicitudes.filter(estado=Estado.EN_CURSO)
+    sumar('prestamos_activos', en_curso.filter(solicitante_id__in=ids), 'solicitante_id')
+    sumar(
+        'prestamos_activos',
+        en_curso.filter(objeto__propietario_id__in=ids).exclude(solicitante_id=F('objeto__propietario_id')),
+        'objeto__propietario_id',
+    )
+    completadas = solicitudes.filter(estado=Estado.COMPLETADA)
+    valoro_solicitante = Valoracion.objects.filter(solicitud=OuterRef('pk'), usuario_que_valora=OuterRef('solicitante'))
+    valoro_propietario = Valoracion.objects.filter(solicitud=OuterRef('pk'), usuario_que_valora=OuterRef('objeto__propietario'))
+    sumar(
+        'valoraciones_pendientes',
+        completadas.filter(solicitante_id__in=ids).exclude(Exists(valoro_solicitante)),
+        'solicitante_id',
+    )
+    sumar(
+        'valoraciones_pendientes',
+        completadas.filter(objeto__propietario_id__in=ids)
+        .exclude(solicitante_id=F('objeto__propietario_id'))
+        .exclude(Exists(valoro_propietario)),
+        'objeto__propietario_id',
+    )
+    return valores
+
+
+def recalcular(user_ids, tamano_lote=1000):
+    # Reescribe los contadores por lotes de usuarios (comando recalcular_contadores)
+    lote = []
+    total = 0
+    for user_id in user_ids:
+        lote.append(user_id)
+        if len(lote) >= tamano_lote:
+            total += _guardar(calcular(lote))
+            lote = []
+    if lote:
+        total += _guardar(calcular(lote))
+    return total
+
+
+def obtener(user_id):
+    contadores = ContadoresUsuario.objects.filter(user_id=user_id).first()
+    if contadores is None:
+        recalcular([user_id])
+        contadores = ContadoresUsuario.objects.get(user_id=user_id)
+    return contadores
+
+
+def _guardar(valores):
+    ContadoresUsuario.objects.bulk_create(
+        [ContadoresUsuario(user_id=user_id, **campos) for user_id, campos in valores.items()],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=list(CAMPOS),
+    )
+    return len(valores)
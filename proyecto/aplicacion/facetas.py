@@ -0,0 +1,81 @@
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
+
+FACETAS = ('categoria', 'disponible_para', 'localidad_actual')
+CLAVE_VERSION = 'facetas_objetos:version'
+TIMEOUT = getattr(settings, 'FACETAS_OBJETOS_TIMEOUT', 300)
+# Parámetros que no cambian el resultado de los conteos
+PARAMETROS_IGNORADOS = {'page', 'page_size', 'format'}
+
+
+def invalidar():
+    # Cambiar la versión deja huérfanas todas las entradas anteriores (expiran solas).
+    # Se hace tras el commit: antes, otra petición podría recalcular con los datos viejos
+    # y guardarlos ya con la versión nueva. La caché debe ser compartida (ver CACHES en settings).
+    # robust: si la caché no responde se registra el error, pero la escritura ya confirmada no falla.
+    transaction.on_commit(lambda: cache.set(CLAVE_VERSION, uuid.uuid4().hex, None), robust=True)
+
+
+def version_actual():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, uuid.uuid4().hex, None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def clave_cache(query_params):
+    parametros = sorted(
+        (clave, valor)
+        for clave, valores in query_params.lists() if clave not in PARAMETROS_IGNORADOS
+        for valor in valores
+    )
+    firma = hashlib.sha1(urlencode(parametros).encode()).hexdigest()
+    return f'facetas_objetos:{version_actual()}:{firma}'
+
+
+def calcular(view, request):
+    """
+    Conteos por categoría, disponibilidad y localidad para los filtros actuales.
+    Cada faceta se cuenta aplicando todos los filtros salvo el suyo propio, para que
+    el cliente pueda mostrar cuántos objetos obtendría al cambiar ese valor.
+    """
+    queryset = view.get_queryset()
+    # Búsqueda de texto y demás backends distintos de django-filter se aplican a todo
+    for backend in view.filter_backends:
+        if not issubclass(backend, DjangoFilterBackend):
+            queryset = backend().filter_queryset(request, queryset, view)
+    filterset_class = DjangoFilterBackend().get_filterset_class(view, queryset)
+
+    def filtrar(datos):
+        if filterset_class is None:
+            return queryset
+        filterset = filterset_class(datos, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return filterset.qs
+
+    resultado = {'total': filtrar(request.query_params).count()}
+    for campo in FACETAS:
+        datos = request.query_params.copy()
+        datos.pop(campo, None)
+        filas = filtrar(datos).order_by().values(campo).annotate(total=Count('id'))
+        resultado[campo] = [{'valor': fila[campo], 'total': fila['total']} for fila in filas]
+    return resultado
+
+
+def obtener(view, request):
+    clave = clave_cache(request.query_params)
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = calcular(view, request)
+        cache.set(clave, resultado, TIMEOUT)
+    return resultado
@@ -0,0 +1,109 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import CicloIntercambio, Objeto, SolicitudTransaccion
+
+# Límite de ciclos guardados por localidad para acotar tiempo y tamaño de la tabla
+MAX_CICLOS_POR_LOCALIDAD = 500
+
+
+def solicitudes_intercambio_pendientes():
+    return SolicitudTransaccion.objects.filter(
+        tipo_transaccion=SolicitudTransaccion.TipoTransaccion.INTERCAMBIO,
+        estado=SolicitudTransaccion.EstadoSolicitud.PENDIENTE,
+        objeto__activo=True,
+        objeto__disponible_para__in=[Objeto.TipoDisponibilidad.INTERCAMBIO, Objeto.TipoDisponibilidad.TODOS],
+    )
+
+
+def construir_grafo(localidad_id):
+    """
+    Grafo de deseos de una localidad: arista usuario -> propietario cuando el usuario
+    ha pedido a cambio un objeto del propietario. Por cada par se guarda la solicitud
+    más antigua. Devuelve {usuario: {propietario: solicitud_id}}.
+    """
+    grafo = defaultdict(dict)
+    filas = (
+        solicitudes_intercambio_pendientes()
+        .filter(objeto__localidad_actual_id=localidad_id)
+        .order_by('id')
+        .values_list('id', 'solicitante_id', 'objeto__propietario_id')
+        .iterator()
+    )
+    for solicitud_id, solicitante_id, propietario_id in filas:
+        if solicitante_id != propietario_id:
+            grafo[solicitante_id].setdefault(propietario_id, solicitud_id)
+    return grafo
+
+
+def podar(grafo):
+    # Quita iterativamente los usuarios sin aristas de entrada o de salida: nunca cierran un ciclo
+    entrantes = defaultdict(set)
+    for u, destinos in grafo.items():
+        for v in destinos:
+            entrantes[v].add(u)
+    pendientes = [u for u in set(grafo) | set(entrantes) if not grafo.get(u) or not entrantes.get(u)]
+    while pendientes:
+        u = pendientes.pop()
+        for v in grafo.pop(u, {}):
+            entrantes[v].discard(u)
+            if not entrantes[v]:
+                pendientes.append(v)
+        for w in entrantes.pop(u, set()):
+            destinos = grafo.get(w)
+            if destinos is not None:
+                destinos.pop(u, None)
+                if not destinos:
+                    pendientes.append(w)
+    return grafo
+
+
+def buscar_ciclos(grafo, limite=MAX_CICLOS_POR_LOCALIDAD):
+    """
+    Busca ciclos de 2 y 3 usuarios. Cada ciclo se genera una sola vez empezando por
+    su usuario de id menor. Devuelve listas de (usuario, solicitud_id), primero los de 2.
+    """
+    grafo = podar(grafo)
+    ciclos = []
+    for tamano in (2, 3):
+        for u in sorted(grafo):
+            for v, s_uv in grafo[u].items():
+                if v <= u or v not in grafo:
+                    continue
+                if tamano == 2:
+                    s_vu = grafo[v].get(u)
+                    if s_vu is not None:
+                        ciclos.append([(u, s_uv), (v, s_vu)])
+                        if len(ciclos) >= limite:
+                            return ciclos
+                else:
+                    for w, s_vw in grafo[v].items():
+                        if w <= u or w == v or w not in grafo:
+                            continue
+                        s_wu = grafo[w].get(u)
+                        if s_wu is not None:
+                            ciclos.append([(u, s_uv), (v, s_vw), (w, s_wu)])
+                            if len(ciclos) >= limite:
+                                return ciclos
+    return ciclos
+
+
+def recalcular_localidad(localidad_id, limite=MAX_CICLOS_POR_LOCALIDAD):
+    ciclos = buscar_ciclos(construir_grafo(localidad_id), limite=limite)
+    with transaction.atomic():
+        CicloIntercambio.objects.filter(localidad_id=localidad_id).delete()
+        creados = CicloIntercambio.objects.bulk_create(
+            [CicloIntercambio(localidad_id=localidad_id, tamano=len(ciclo)) for ciclo in ciclos]
+        )
+        Participantes = CicloIntercambio.participantes.through
+        Solicitudes = CicloIntercambio.solicitudes.through
+        Participantes.objects.bulk_create(
+            [Participantes(ciclointercambio_id=c.id, user_id=u) for c, ciclo in zip(creados, ciclos) for u, _ in ciclo],
+            batch_size=1000,
+        )
+        Solicitudes.objects.bulk_create(
+            [Solicitudes(ciclointercambio_id=c.id, solicitudtransaccion_id=s) for c, ciclo in zip(creados, ciclos) for _, s in ciclo],
+            batch_size=1000,
+        )
+    return len(ciclos)
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from aplicacion.archivo import DIAS_ARCHIVO, TAMANO_LOTE, archivar_lote, fecha_limite
+
+
+class Command(BaseCommand):
+    help = "Mueve las solicitudes finalizadas más antiguas que --dias a la tabla de archivo, por lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS_ARCHIVO, help="Antigüedad mínima (desde el cierre) para archivar.")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Solicitudes movidas por transacción.")
+        parser.add_argument('--pausa', type=float, default=0.1, help="Segundos de espera entre lotes.")
+        parser.add_argument('--max-lotes', type=int, default=None, help="Detenerse tras este número de lotes.")
+
+    def handle(self, *args, **options):
+        limite = fecha_limite(options['dias'])
+        total = lotes = 0
+        while options['max_lotes'] is None or lotes < options['max_lotes']:
+            movidas = archivar_lote(limite, options['lote'])
+            if not movidas:
+                break
+            total += movidas
+            lotes += 1
+            time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f"{total} solicitudes archivadas en {lotes} lotes."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from aplicacion.intercambios import MAX_CICLOS_POR_LOCALIDAD, recalcular_localidad, solicitudes_intercambio_pendientes
+from aplicacion.models import CicloIntercambio
+
+
+class Command(BaseCommand):
+    help = "Busca ciclos de intercambio de 2 y 3 usuarios entre las solicitudes de intercambio pendientes de cada localidad."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=MAX_CICLOS_POR_LOCALIDAD, help="Máximo de ciclos guardados por localidad.")
+
+    def handle(self, *args, **options):
+        localidades = set(
+            solicitudes_intercambio_pendientes()
+            .values_list('objeto__localidad_actual', flat=True)
+            .order_by()
+            .distinct()
+        )
+        # Localidades que ya no tienen solicitudes pendientes pierden sus ciclos antiguos
+        CicloIntercambio.objects.exclude(localidad_id__in=localidades).delete()
+
+        total = 0
+        for localidad_id in sorted(localidades):
+            total += recalcular_localidad(localidad_id, limite=options['limite'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(localidades)} localidades procesadas, {total} ciclos de intercambio sugeridos."
+        ))
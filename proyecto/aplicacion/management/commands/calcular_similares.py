@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from aplicacion.models import Objeto
+from aplicacion.recomendaciones import TOP_K, localidades_pendientes, recalcular_localidad
+
+
+class Command(BaseCommand):
+    help = "Precalcula los objetos similares de cada objeto, agrupados por localidad."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help="Recalcula todas las localidades y todos sus objetos, no solo los que han cambiado.")
+        parser.add_argument('--k', type=int, default=TOP_K, help="Número de vecinos a guardar por objeto.")
+
+    def handle(self, *args, **options):
+        if options['todas']:
+            localidades = list(Objeto.objects.values_list('localidad_actual', flat=True).order_by().distinct())
+        else:
+            localidades = localidades_pendientes()
+
+        total = 0
+        for localidad_id in localidades:
+            total += recalcular_localidad(localidad_id, k=options['k'], completo=options['todas'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(localidades)} localidades recalculadas, {total} vecinos guardados."
+        ))
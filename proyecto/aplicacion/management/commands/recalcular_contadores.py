@@ -0,0 +1,19 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from aplicacion.contadores import recalcular
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero los contadores del resumen de usuario (/api/perfiles/me/resumen/)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, action='append', help="Id de usuario a recalcular (se puede repetir). Por defecto, todos.")
+        parser.add_argument('--lote', type=int, default=1000, help="Usuarios recalculados por consulta.")
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.order_by('pk')
+        if options['usuario']:
+            usuarios = usuarios.filter(pk__in=options['usuario'])
+        total = recalcular(usuarios.values_list('pk', flat=True).iterator(chunk_size=options['lote']), tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"Contadores recalculados para {total} usuarios."))
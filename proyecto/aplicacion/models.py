@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast, Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import OpClass
 from django.utils.translation import gettext_lazy as _ # Para cadenas traducibles
 
 class Localidad(models.Model):
@@ -43,7 +45,13 @@ class CategoriaObjeto(models.Model):
         verbose_name_plural = _("Categorías de Objetos")
         ordering = ['nombre']
 
-class Objeto(models.Model):
+class GuardadoAtomico:
+    # save() en su propia transacción: el pre_save de signals.py bloquea la fila hasta que se aplican los contadores
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class Objeto(GuardadoAtomico, models.Model):
     class TipoDisponibilidad(models.TextChoices):
         PRESTAMO = 'PR', _('Préstamo')
         ALQUILER = 'AL', _('Alquiler')
@@ -64,7 +72,7 @@ class Objeto(models.Model):
     )
     precio_alquiler_por_dia = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name=_("Precio Alquiler por Día (€)"))
     condiciones_intercambio = models.TextField(blank=True, null=True, verbose_name=_("Condiciones para Intercambio"))
-    fecha_publicacion = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha de Publicación"))
+    fecha_publicacion = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_("Fecha de Publicación"))
     ultima_modificacion = models.DateTimeField(auto_now=True, verbose_name=_("Última Modificación"))
     activo = models.BooleanField(default=True, verbose_name=_("Activo/Disponible")) # Si el objeto está listado y disponible en general
     # Podríamos añadir un campo de estado más granular, ej: 'disponible', 'prestado', 'en_alquiler_activo'
@@ -76,6 +84,12 @@ class Objeto(models.Model):
         verbose_name = _("Objeto")
         verbose_name_plural = _("Objetos")
         ordering = ['-fecha_publicacion']
+        indexes = [
+            # Búsquedas por prefijo sin distinguir mayúsculas (nombre__istartswith, p. ej. en el admin)
+            models.Index(OpClass(Upper(Cast('nombre', models.TextField())), name='text_pattern_ops'), name='objeto_nombre_upper_idx'),
+            # Objetos modificados desde el último cálculo de similares (recomendaciones.recalcular_localidad)
+            models.Index(fields=['localidad_actual', 'ultima_modificacion'], name='objeto_localidad_modif_idx'),
+        ]
 
 class FotoObjeto(models.Model):
     objeto = models.ForeignKey(Objeto, related_name='fotos', on_delete=models.CASCADE, verbose_name=_("Objeto"))
@@ -91,8 +105,38 @@ class FotoObjeto(models.Model):
         verbose_name_plural = _("Fotos de Objetos")
         ordering = ['fecha_subida']
 
+class ObjetoSimilar(models.Model):
+    # Vecinos precalculados por el comando calcular_similares (ver recomendaciones.py)
+    objeto = models.ForeignKey(Objeto, on_delete=models.CASCADE, related_name='similares', verbose_name=_("Objeto"))
+    similar = models.ForeignKey(Objeto, on_delete=models.CASCADE, related_name='+', verbose_name=_("Objeto Similar"))
+    puntuacion = models.FloatField(verbose_name=_("Puntuación de Similitud"))
+    calculado_en = models.DateTimeField(verbose_name=_("Calculado en"))
+
+    def __str__(self):
+        return f"{self.objeto_id} ~ {self.similar_id} ({self.puntuacion:.3f})"
+
+    class Meta:
+        verbose_name = _("Objeto Similar")
+        verbose_name_plural = _("Objetos Similares")
+        ordering = ['objeto', '-puntuacion']
+        unique_together = [['objeto', 'similar']]
+        indexes = [models.Index(fields=['objeto', '-puntuacion'], name='objetosimilar_objeto_punt_idx')]
+
+class EjecucionSimilares(models.Model):
+    # Último cálculo de vecinos de cada localidad, para que calcular_similares solo rehaga las que cambiaron
+    localidad = models.OneToOneField(Localidad, on_delete=models.CASCADE, primary_key=True, related_name='+', verbose_name=_("Localidad"))
+    ultima_ejecucion = models.DateTimeField(verbose_name=_("Última Ejecución"))
+
+    def __str__(self):
+        return f"{self.localidad_id}: {self.ultima_ejecucion}"
+
+    class Meta:
+        verbose_name = _("Ejecución de Objetos Similares")
+        verbose_name_plural = _("Ejecuciones de Objetos Similares")
+
 # --- Modelos para Transacciones (Borrador inicial) ---
-class SolicitudTransaccion(models.Model):
+class SolicitudTransaccionBase(models.Model):
+    # Campos comunes a las solicitudes activas y a las archivadas (ver SolicitudTransaccionArchivada)
     class TipoTransaccion(models.TextChoices):
         PRESTAMO = 'PR', _('Préstamo')
         ALQUILER = 'AL', _('Alquiler')
@@ -108,13 +152,21 @@ class SolicitudTransaccion(models.Model):
         COMPLETADA = 'CO', _('Completada')
         DISPUTA = 'DI', _('En Disputa')
 
+    # Estados que ya no cambian; candidatos a archivarse
+    ESTADOS_FINALES = (
+        EstadoSolicitud.RECHAZADA,
+        EstadoSolicitud.CANCELADA_SOLICITANTE,
+        EstadoSolicitud.CANCELADA_PROPIETARIO,
+        EstadoSolicitud.COMPLETADA,
+    )
+
     objeto = models.ForeignKey(Objeto, on_delete=models.CASCADE, related_name='solicitudes', verbose_name=_("Objeto Solicitado"))
     solicitante = models.ForeignKey(User, on_delete=models.CASCADE, related_name='solicitudes_realizadas', verbose_name=_("Solicitante"))
     # propietario_objeto se puede obtener de objeto.propietario
     tipo_transaccion = models.CharField(max_length=2, choices=TipoTransaccion.choices, verbose_name=_("Tipo de Transacción"))
     estado = models.CharField(max_length=2, choices=EstadoSolicitud.choices, default=EstadoSolicitud.PENDIENTE, verbose_name=_("Estado"))
 
-    fecha_solicitud = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha de Solicitud"))
+    fecha_solicitud = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_("Fecha de Solicitud"))
     fecha_inicio_deseada = models.DateField(null=True, blank=True, verbose_name=_("Fecha Inicio Deseada")) # Para alquiler/préstamo
     fecha_fin_deseada = models.DateField(null=True, blank=True, verbose_name=_("Fecha Fin Deseada"))     # Para alquiler/préstamo
     mensaje_solicitud = models.TextField(blank=True, null=True, verbose_name=_("Mensaje para el Propietario"))
@@ -135,12 +187,62 @@ class SolicitudTransaccion(models.Model):
         return f"Solicitud de {self.solicitante.username} para {self.objeto.nombre} ({self.get_tipo_transaccion_display()})"
 
     class Meta:
+        abstract = True
         verbose_name = _("Solicitud de Transacción")
         verbose_name_plural = _("Solicitudes de Transacciones")
         ordering = ['-fecha_solicitud']
 
-class Valoracion(models.Model):
-    solicitud = models.ForeignKey(SolicitudTransaccion, on_delete=models.CASCADE, related_name='valoraciones', verbose_name=_("Transacción Valorada"))
+class SolicitudTransaccion(GuardadoAtomico, SolicitudTransaccionBase):
+    pass
+
+class SolicitudTransaccionArchivada(SolicitudTransaccionBase):
+    # Solicitudes en estado final movidas por el comando archivar_solicitudes; conservan su id original
+    id = models.BigIntegerField(primary_key=True)
+    objeto = models.ForeignKey(Objeto, on_delete=models.CASCADE, related_name='solicitudes_archivadas', verbose_name=_("Objeto Solicitado"))
+    solicitante = models.ForeignKey(User, on_delete=models.CASCADE, related_name='solicitudes_archivadas', verbose_name=_("Solicitante"))
+    objeto_ofrecido_intercambio = models.ForeignKey(Objeto, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name=_("Objeto Ofrecido a Cambio"))
+    fecha_solicitud = models.DateTimeField(db_index=True, verbose_name=_("Fecha de Solicitud")) # Sin auto_now_add: se copia la original
+
+    class Meta(SolicitudTransaccionBase.Meta):
+        verbose_name = _("Solicitud de Transacción Archivada")
+        verbose_name_plural = _("Solicitudes de Transacciones Archivadas")
+
+class ContadoresUsuario(models.Model):
+    # Contadores del resumen del usuario; se mantienen en signals.py (ver contadores.py) y se pueden
+    # reconstruir con el comando recalcular_contadores
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='contadores', verbose_name=_("Usuario"))
+    objetos_publicados = models.IntegerField(default=0, verbose_name=_("Objetos Publicados"))
+    solicitudes_recibidas_pendientes = models.IntegerField(default=0, verbose_name=_("Solicitudes Recibidas Pendientes"))
+    prestamos_activos = models.IntegerField(default=0, verbose_name=_("Préstamos/Alquileres en Curso"))
+    valoraciones_pendientes = models.IntegerField(default=0, verbose_name=_("Valoraciones Pendientes"))
+
+    def __str__(self):
+        return f"Contadores de {self.user_id}"
+
+    class Meta:
+        verbose_name = _("Contadores de Usuario")
+        verbose_name_plural = _("Contadores de Usuarios")
+
+class CicloIntercambio(models.Model):
+    # Intercambio múltiple sugerido (2 o 3 usuarios), generado por el comando buscar_ciclos_intercambio
+    localidad = models.ForeignKey(Localidad, on_delete=models.CASCADE, related_name='ciclos_intercambio', verbose_name=_("Localidad"))
+    participantes = models.ManyToManyField(User, related_name='ciclos_intercambio', verbose_name=_("Participantes"))
+    solicitudes = models.ManyToManyField(SolicitudTransaccion, related_name='ciclos_intercambio', verbose_name=_("Solicitudes del Ciclo"))
+    tamano = models.PositiveSmallIntegerField(verbose_name=_("Número de Participantes"))
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha de Creación"))
+
+    def __str__(self):
+        return f"Ciclo de intercambio {self.id} ({self.tamano} participantes)"
+
+    class Meta:
+        verbose_name = _("Ciclo de Intercambio")
+        verbose_name_plural = _("Ciclos de Intercambio")
+        ordering = ['tamano', '-fecha_creacion']
+
+class Valoracion(GuardadoAtomico, models.Model):
+    solicitud = models.ForeignKey(SolicitudTransaccion, on_delete=models.CASCADE, null=True, blank=True, related_name='valoraciones', verbose_name=_("Transacción Valorada"))
+    # Al archivar la solicitud, la valoración pasa a apuntar aquí (solicitud queda a NULL)
+    solicitud_archivada = models.ForeignKey(SolicitudTransaccionArchivada, on_delete=models.CASCADE, null=True, blank=True, related_name='valoraciones', verbose_name=_("Transacción Valorada (Archivada)"))
     # Se puede valorar al solicitante o al propietario
     usuario_que_valora = models.ForeignKey(User, on_delete=models.CASCADE, related_name='valoraciones_emitidas', verbose_name=_("Usuario que Valora"))
     usuario_valorado = models.ForeignKey(User, on_delete=models.CASCADE, related_name='valoraciones_recibidas', verbose_name=_("Usuario Valorado"))
@@ -151,8 +253,12 @@ class Valoracion(models.Model):
     def __str__(self):
         return f"Valoración de {self.usuario_que_valora.username} a {self.usuario_valorado.username} ({self.puntuacion} estrellas)"
 
+    @property
+    def solicitud_efectiva(self):
+        return self.solicitud or self.solicitud_archivada
+
     class Meta:
         verbose_name = _("Valoración")
         verbose_name_plural = _("Valoraciones")
         ordering = ['-fecha_valoracion']
-        unique_together = [['solicitud', 'usuario_que_valora', 'usuario_valorado']] # Evitar múltiples valoraciones de la misma persona a otra por la misma transacción
\ No newline at end of file
+        unique_together = [['solicitud', 'usuario_que_valora', 'usuario_valorado'], ['solicitud_archivada', 'usuario_que_valora', 'usuario_valorado']] # Evitar múltiples valoraciones de la misma persona a otra por la misma transacción
\ No newline at end of file
@@ -0,0 +1,222 @@
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import EjecucionSimilares, Objeto, ObjetoSimilar
+
+# Vecinos guardados por objeto y fracción máxima de objetos de una localidad
+# en la que puede aparecer un término antes de ignorarlo (equivalente a max_df).
+# El corte solo se aplica a partir de MIN_OBJETOS_MAX_DF objetos: en localidades
+# pequeñas basta con la ponderación IDF.
+TOP_K = getattr(settings, 'OBJETOS_SIMILARES_TOP_K', 10)
+MAX_DF = getattr(settings, 'OBJETOS_SIMILARES_MAX_DF', 0.5)
+MIN_OBJETOS_MAX_DF = getattr(settings, 'OBJETOS_SIMILARES_MIN_OBJETOS_MAX_DF', 50)
+# De cada lista del índice invertido solo se recorren los objetos con más peso en el término,
+# para que el coste por objeto no crezca con el tamaño de la localidad
+MAX_LISTA = getattr(settings, 'OBJETOS_SIMILARES_MAX_LISTA', 100)
+
+# El nombre pesa más que la descripción. La categoría no genera candidatos (la comparten
+# demasiados objetos): suma un extra a la puntuación y sirve de relleno si el texto no da vecinos.
+PESO_NOMBRE = 2.0
+BONUS_CATEGORIA = 0.25
+# Candidatos del índice que se puntúan con el producto exacto, por cada vecino pedido
+CANDIDATOS_POR_VECINO = 3
+
+PALABRAS_VACIAS = frozenset("""
+    a al algo con de del el en es esta este la las lo los mas muy no o para
+    pero por que se sin su sus un una uno unos unas y ya
+""".split())
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenizar(texto):
+    if not texto:
+        return []
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in _TOKEN_RE.findall(texto) if len(t) > 2 and t not in PALABRAS_VACIAS and not t.isdigit()]
+
+
+def frecuencias(objeto):
+    # objeto es una tupla (id, nombre, descripcion, categoria_id) obtenida con values_list
+    _, nombre, descripcion, _ = objeto
+    tf = Counter()
+    for token in tokenizar(nombre):
+        tf[token] += PESO_NOMBRE
+    for token in tokenizar(descripcion):
+        tf[token] += 1.0
+    return tf
+
+
+def indexar(objetos, max_df=MAX_DF, min_objetos_max_df=MIN_OBJETOS_MAX_DF, max_lista=MAX_LISTA):
+    """
+    Prepara los datos de una localidad: vectores TF-IDF del texto (dict término -> peso)
+    normalizados, índice invertido recortado a las max_lista entradas de más peso y
+    objetos agrupados por categoría.
+    """
+    tfs = {o[0]: frecuencias(o) for o in objetos}
+    n = len(tfs)
+    df = Counter()
+    for tf in tfs.values():
+        df.update(tf.keys())
+    limite_df = max(2, int(max_df * n)) if n >= min_objetos_max_df else n
+    # Términos que aparecen en un solo objeto no aportan vecinos; los muy comunes apenas discriminan
+    idf = {t: math.log(n / c) + 1.0 for t, c in df.items() if 1 < c <= limite_df}
+
+    vectores = {}
+    indice = defaultdict(list)
+    for objeto_id, tf in tfs.items():
+        vec = {t: (1.0 + math.log(f)) * idf[t] for t, f in tf.items() if t in idf}
+        norma = math.sqrt(sum(w * w for w in vec.values()))
+        vectores[objeto_id] = {t: w / norma for t, w in vec.items()} if norma else {}
+        for t, w in vectores[objeto_id].items():
+            indice[t].append((w, objeto_id))
+    for t, lista in indice.items():
+        if len(lista) > max_lista:
+            indice[t] = heapq.nlargest(max_lista, lista)
+
+    categorias = {o[0]: o[3] for o in objetos}
+    por_categoria = defaultdict(list)
+    for objeto_id, categoria_id in categorias.items():
+        if categoria_id is not None:
+            por_categoria[categoria_id].append(objeto_id)
+    return {'vectores': vectores, 'indice': indice, 'categorias': categorias, 'por_categoria': por_categoria}
+
+
+def _producto(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(t, 0.0) for t, w in a.items())
+
+
+def vecinos_objeto(datos, objeto_id, k=TOP_K):
+    # Devuelve [(similar_id, puntuacion), ...] de mayor a menor puntuación
+    vec = datos['vectores'][objeto_id]
+    categorias = datos['categorias']
+    acumulado = defaultdict(float)
+    for t, w in vec.items():
+        for wj, j in datos['indice'][t]:
+            if j != objeto_id:
+                acumulado[j] += w * wj
+    candidatos = set(heapq.nlargest(CANDIDATOS_POR_VECINO * k, acumulado, key=acumulado.get))
+    categoria_id = categorias[objeto_id]
+    if categoria_id is not None:
+        # Relleno acotado: los más recientes de la misma categoría
+        candidatos.update(datos['por_categoria'][categoria_id][-(k + 1):])
+    candidatos.discard(objeto_id)
+
+    puntuaciones = []
+    for j in candidatos:
+        puntuacion = _producto(vec, datos['vectores'][j])
+        if categoria_id is not None and categorias[j] == categoria_id:
+            puntuacion += BONUS_CATEGORIA
+        if puntuacion > 0:
+            puntuaciones.append((j, puntuacion))
+    return heapq.nlargest(k, puntuaciones, key=lambda par: (par[1], -par[0]))
+
+
+def vecinos_localidad(objetos, k=TOP_K, objetivos=None, **opciones):
+    """
+    Calcula los k vecinos más parecidos de los objetos de una misma localidad (de todos,
+    o solo de los ids de objetivos). Devuelve un dict {objeto_id: [(similar_id, puntuacion), ...]}.
+    """
+    if len(objetos) < 2:
+        return {}
+    datos = indexar(objetos, **opciones)
+    if objetivos is None:
+        objetivos = datos['vectores']
+    resultado = {}
+    for objeto_id in objetivos:
+        if objeto_id in datos['vectores']:
+            mejores = vecinos_objeto(datos, objeto_id, k)
+            if mejores:
+                resultado[objeto_id] = mejores
+    return resultado
+
+
+def localidades_pendientes():
+    # Una localidad se recalcula si alguno de sus objetos cambió después de su último cálculo
+    ultimas = dict(EjecucionSimilares.objects.values_list('localidad_id', 'ultima_ejecucion'))
+    cambios = (
+        Objeto.objects.values('localidad_actual')
+        .annotate(ultimo=Max('ultima_modificacion'))
+        .values_list('localidad_actual', 'ultimo')
+    )
+    return [loc for loc, ultimo in cambios if loc not in ultimas or ultimo >= ultimas[loc]]
+
+
+def recalcular_localidad(localidad_id, k=TOP_K, completo=False):
+    """
+    Rehace los vecinos de una localidad. Salvo en la primera pasada (o con completo=True)
+    solo se recalculan los objetos modificados desde la última, los que los tenían como
+    vecinos, los que pasan a tenerlos y los que apuntan a objetos que ya no están activos aquí.
+    Devuelve el número de vecinos guardados.
+    """
+    # La marca se toma antes de leer: lo que cambie durante el cálculo se recogerá en la siguiente pasada
+    inicio = timezone.now()
+    ejecucion = EjecucionSimilares.objects.filter(localidad_id=localidad_id).first()
+    objetos = list(
+        Objeto.objects.filter(localidad_actual_id=localidad_id, activo=True)
+        .values_list('id', 'nombre', 'descripcion', 'categoria_id')
+        .order_by('id')
+    )
+    datos = indexar(objetos)
+    activos = datos['vectores']
+
+    if completo or ejecucion is None:
+        cambiados = None
+        objetivos = set(activos)
+    else:
+        cambiados = set(
+            Objeto.objects.filter(localidad_actual_id=localidad_id, ultima_modificacion__gte=ejecucion.ultima_ejecucion)
+            .values_list('id', flat=True)
+        )
+        objetivos = set(cambiados)
+        objetivos.update(ObjetoSimilar.objects.filter(similar_id__in=cambiados).values_list('objeto_id', flat=True))
+        # Vecinos que se han ido a otra localidad, desactivado o borrado
+        objetivos.update(
+            ObjetoSimilar.objects.filter(objeto__localidad_actual_id=localidad_id)
+            .exclude(similar__localidad_actual_id=localidad_id, similar__activo=True)
+            .values_list('objeto_id', flat=True)
+        )
+
+    vecinos = {}
+    if len(activos) >= 2:
+        for objeto_id in objetivos & activos.keys():
+            vecinos[objeto_id] = vecinos_objeto(datos, objeto_id, k)
+        if cambiados is not None:
+            # La similitud es simétrica: quien entra en los vecinos de un objeto cambiado puede querer tenerlo
+            for objeto_id in cambiados & activos.keys():
+                for similar_id, _ in vecinos[objeto_id]:
+                    if similar_id not in vecinos:
+                        vecinos[similar_id] = vecinos_objeto(datos, similar_id, k)
+                        objetivos.add(similar_id)
+
+    filas = [
+        ObjetoSimilar(objeto_id=objeto_id, similar_id=similar_id, puntuacion=puntuacion, calculado_en=inicio)
+        for objeto_id, lista in vecinos.items()
+        for similar_id, puntuacion in lista
+    ]
+    with transaction.atomic():
+        if cambiados is None:
+            ObjetoSimilar.objects.filter(objeto__localidad_actual_id=localidad_id).delete()
+            movidos = Objeto.objects.filter(localidad_actual_id=localidad_id).values('pk')
+        else:
+            ObjetoSimilar.objects.filter(objeto_id__in=objetivos).delete()
+            movidos = cambiados
+        # Vecinos de otras localidades que apuntan a objetos que se han mudado aquí
+        ObjetoSimilar.objects.filter(similar_id__in=movidos).exclude(
+            objeto__localidad_actual_id=localidad_id
+        ).delete()
+        ObjetoSimilar.objects.bulk_create(filas, batch_size=1000)
+        # Se guarda aunque no haya vecinos, para no volver a recalcularla si no cambia nada
+        EjecucionSimilares.objects.update_or_create(localidad_id=localidad_id, defaults={'ultima_ejecucion': inicio})
+    return len(filas)
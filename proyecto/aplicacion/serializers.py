@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Localidad, CategoriaObjeto, PerfilUsuario, Objeto, FotoObjeto, SolicitudTransaccion, Valoracion
+from .models import Localidad, CategoriaObjeto, PerfilUsuario, Objeto, ObjetoSimilar, FotoObjeto, SolicitudTransaccion, CicloIntercambio, ContadoresUsuario, Valoracion
 from django.contrib.auth.models import User
 
 class LocalidadSerializer(serializers.ModelSerializer):
@@ -31,6 +31,11 @@ class PerfilUsuarioSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'localidad_predeterminada', 'localidad_predeterminada_nombre', 'telefono', 'foto_perfil', 'reputacion']
         # 'localidad_predeterminada' será el ID, 'localidad_predeterminada_nombre' mostrará el nombre.
 
+class ContadoresUsuarioSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ContadoresUsuario
+        fields = ['objetos_publicados', 'solicitudes_recibidas_pendientes', 'prestamos_activos', 'valoraciones_pendientes']
+
 class FotoObjetoSerializer(serializers.ModelSerializer): # Necesitamos este primero para ObjetoSerializer
     class Meta:
         model = FotoObjeto
@@ -55,6 +60,18 @@ class ObjetoSerializer(serializers.ModelSerializer):
         # 'categoria' y 'localidad_actual' serán los IDs.
         # 'categoria_nombre' y 'localidad_actual_nombre' mostrarán los nombres.
 
+class ObjetoSimilarSerializer(serializers.ModelSerializer):
+    # Versión compacta: solo los datos del objeto similar que se cargan con select_related('similar')
+    id = serializers.IntegerField(source='similar_id', read_only=True)
+    nombre = serializers.CharField(source='similar.nombre', read_only=True)
+    categoria = serializers.IntegerField(source='similar.categoria_id', read_only=True, allow_null=True)
+    localidad_actual = serializers.IntegerField(source='similar.localidad_actual_id', read_only=True)
+    disponible_para = serializers.CharField(source='similar.disponible_para', read_only=True)
+
+    class Meta:
+        model = ObjetoSimilar
+        fields = ['id', 'nombre', 'categoria', 'localidad_actual', 'disponible_para', 'puntuacion']
+
 class SolicitudTransaccionSerializer(serializers.ModelSerializer):
     objeto = ObjetoSerializer(read_only=True) # Objeto completo, solo lectura en este nivel
     solicitante = UserSerializer(read_only=True)
@@ -98,8 +115,30 @@ class SolicitudTransaccionSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class PasoCicloIntercambioSerializer(serializers.ModelSerializer):
+    # Cada paso del ciclo es una solicitud: el solicitante recibe el objeto de su propietario
+    solicitante = serializers.IntegerField(source='solicitante_id', read_only=True)
+    objeto_id = serializers.IntegerField(read_only=True)
+    objeto_nombre = serializers.CharField(source='objeto.nombre', read_only=True)
+    propietario = serializers.IntegerField(source='objeto.propietario_id', read_only=True)
+
+    class Meta:
+        model = SolicitudTransaccion
+        fields = ['id', 'solicitante', 'objeto_id', 'objeto_nombre', 'propietario']
+
+
+class CicloIntercambioSerializer(serializers.ModelSerializer):
+    solicitudes = PasoCicloIntercambioSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = CicloIntercambio
+        fields = ['id', 'localidad', 'tamano', 'fecha_creacion', 'solicitudes']
+
+
 class ValoracionSerializer(serializers.ModelSerializer):
-    solicitud_detalle = SolicitudTransaccionSerializer(source='solicitud', read_only=True) # Detalle de la solicitud
+    # solicitud_efectiva: la solicitud activa o, si ya se archivó, su copia en SolicitudTransaccionArchivada
+    solicitud = serializers.IntegerField(source='solicitud_efectiva.id', read_only=True)
+    solicitud_detalle = SolicitudTransaccionSerializer(source='solicitud_efectiva', read_only=True) # Detalle de la solicitud
     usuario_que_valora_detalle = UserSerializer(source='usuario_que_valora', read_only=True)
     usuario_valorado_detalle = UserSerializer(source='usuario_valorado', read_only=True)
 
@@ -136,7 +175,7 @@ class ValoracionSerializer(serializers.ModelSerializer):
         # Si estamos actualizando, la solicitud podría no estar en 'data' si no se cambia.
         # En ese caso, la obtenemos de la instancia del serializer.
         if self.instance:
-            solicitud = self.instance.solicitud if solicitud is None else solicitud
+            solicitud = self.instance.solicitud_efectiva if solicitud is None else solicitud
 
         usuario_que_valora = data.get('usuario_que_valora')
         if self.instance and usuario_que_valora is None:
@@ -182,4 +221,16 @@ class ValoracionSerializer(serializers.ModelSerializer):
         # num_valoraciones = Valoracion.objects.filter(usuario_valorado=usuario_valorado).count()
         # perfil_valorado.reputacion = total_puntuacion / num_valoraciones if num_valoraciones > 0 else 0
         # perfil_valorado.save()
-        return valoracion
\ No newline at end of file
+        return valoracion
+
+
+class PeticionBatchSerializer(serializers.Serializer):
+    metodo = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    url = serializers.CharField() # Ruta completa, p. ej. "/api/objetos/?categoria=3"
+    cuerpo = serializers.JSONField(required=False, allow_null=True)
+
+
+class BatchSerializer(serializers.Serializer):
+    MAX_PETICIONES = 20
+
+    peticiones = PeticionBatchSerializer(many=True, allow_empty=False, max_length=MAX_PETICIONES)
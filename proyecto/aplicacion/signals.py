@@ -0,0 +1,97 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import contadores, facetas
+from .models import Objeto, SolicitudTransaccion, Valoracion
+
+
+@receiver([post_save, post_delete], sender=Objeto)
+def invalidar_facetas_objetos(sender, **kwargs):
+    facetas.invalidar()
+
+
+# --- Contadores del resumen de usuario (ver contadores.py) ---
+# pre_save guarda en la instancia la contribución del estado anterior y post_save aplica la diferencia.
+# La fila anterior se lee con select_for_update (save() es atómico, ver models.GuardadoAtomico) para
+# que dos guardados concurrentes no partan del mismo estado y apliquen el mismo delta dos veces.
+
+@receiver(pre_save, sender=Objeto)
+def contadores_objeto_antes(sender, instance, raw=False, **kwargs):
+    anterior = None
+    if not raw and instance.pk:
+        anterior = Objeto.objects.select_for_update().filter(pk=instance.pk).values_list('activo', 'propietario_id').first()
+    instance._contribucion_anterior = contadores.contribucion_objeto(*anterior) if anterior else Counter()
+
+
+@receiver(post_save, sender=Objeto)
+def contadores_objeto_despues(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    nueva = contadores.contribucion_objeto(instance.activo, instance.propietario_id)
+    nueva.subtract(getattr(instance, '_contribucion_anterior', Counter()))
+    contadores.aplicar(nueva)
+
+
+@receiver(post_delete, sender=Objeto)
+def contadores_objeto_borrado(sender, instance, **kwargs):
+    deltas = Counter()
+    deltas.subtract(contadores.contribucion_objeto(instance.activo, instance.propietario_id))
+    contadores.aplicar(deltas)
+
+
+@receiver(pre_save, sender=SolicitudTransaccion)
+def contadores_solicitud_antes(sender, instance, raw=False, **kwargs):
+    anterior = None
+    if not raw and instance.pk:
+        anterior = SolicitudTransaccion.objects.select_for_update(of=('self',)).filter(pk=instance.pk).values_list(
+            'estado', 'solicitante_id', 'objeto__propietario_id'
+        ).first()
+    instance._contribucion_anterior = contadores.contribucion_solicitud(instance.pk, *anterior) if anterior else Counter()
+
+
+@receiver(post_save, sender=SolicitudTransaccion)
+def contadores_solicitud_despues(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    nueva = contadores.contribucion_solicitud(instance.pk, instance.estado, instance.solicitante_id, instance.objeto.propietario_id)
+    nueva.subtract(getattr(instance, '_contribucion_anterior', Counter()))
+    contadores.aplicar(nueva)
+
+
+@receiver(post_delete, sender=SolicitudTransaccion)
+def contadores_solicitud_borrado(sender, instance, **kwargs):
+    # Al archivar los deltas se aplican por lotes (archivo.archivar_lote)
+    if not contadores.por_fila():
+        return
+    propietario_id = Objeto.objects.filter(pk=instance.objeto_id).values_list('propietario_id', flat=True).first()
+    deltas = Counter()
+    deltas.subtract(contadores.contribucion_solicitud(instance.pk, instance.estado, instance.solicitante_id, propietario_id))
+    contadores.aplicar(deltas)
+
+
+@receiver(pre_save, sender=Valoracion)
+def contadores_valoracion_antes(sender, instance, raw=False, **kwargs):
+    anterior = None
+    if not raw and instance.pk:
+        anterior = Valoracion.objects.select_for_update().filter(pk=instance.pk).values_list(
+            'solicitud_id', 'usuario_que_valora_id'
+        ).first()
+    instance._contribucion_anterior = contadores.contribucion_valoracion(instance.pk, *anterior) if anterior else Counter()
+
+
+@receiver(post_save, sender=Valoracion)
+def contadores_valoracion_despues(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    nueva = contadores.contribucion_valoracion(instance.pk, instance.solicitud_id, instance.usuario_que_valora_id)
+    nueva.subtract(getattr(instance, '_contribucion_anterior', Counter()))
+    contadores.aplicar(nueva)
+
+
+@receiver(post_delete, sender=Valoracion)
+def contadores_valoracion_borrada(sender, instance, **kwargs):
+    deltas = Counter()
+    deltas.subtract(contadores.contribucion_valoracion(instance.pk, instance.solicitud_id, instance.usuario_que_valora_id))
+    contadores.aplicar(deltas)
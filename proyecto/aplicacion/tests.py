@@ -1,18 +1,546 @@
-from django.test import TestCase
-from .models import YourModel  # Reemplaza 'YourModel' con el nombre de tu modelo
+import datetime
+from collections import Counter, defaultdict
+from unittest import mock
 
-class YourModelTests(TestCase):
+from django.db.models import F
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import archivo, contadores, facetas
+from .views import LocalidadViewSet
+from . import intercambios
+from .intercambios import buscar_ciclos, podar
+from .models import ContadoresUsuario, Localidad, Objeto, SolicitudTransaccion, SolicitudTransaccionArchivada, Valoracion
+from .recomendaciones import indexar, vecinos_localidad
+
+Estado = SolicitudTransaccion.EstadoSolicitud
+
+
+def grafo_de(aristas):
+    # aristas: (usuario, propietario, solicitud_id), como en intercambios.construir_grafo
+    grafo = defaultdict(dict)
+    for u, v, solicitud_id in aristas:
+        grafo[u].setdefault(v, solicitud_id)
+    return grafo
+
+
+class PodarTests(SimpleTestCase):
+
+    def test_quita_usuarios_sin_entrada_o_sin_salida(self):
+        # 4 solo pide y 5 solo recibe: ninguno puede cerrar un ciclo
+        grafo = podar(grafo_de([(1, 2, 10), (2, 1, 11), (4, 1, 12), (2, 5, 13)]))
+        self.assertEqual(dict(grafo), {1: {2: 10}, 2: {1: 11}})
+
+    def test_poda_en_cadena(self):
+        # Al quitar 3 (sin entradas), 2 se queda sin entradas y también cae
+        grafo = podar(grafo_de([(3, 2, 10), (2, 1, 11), (1, 4, 12)]))
+        self.assertEqual(dict(grafo), {})
+
+
+class BuscarCiclosTests(SimpleTestCase):
+
+    def test_ciclos_de_dos_y_tres(self):
+        grafo = grafo_de([(1, 2, 10), (2, 1, 11), (3, 4, 12), (4, 5, 13), (5, 3, 14), (6, 1, 15)])
+        self.assertEqual(
+            buscar_ciclos(grafo),
+            [[(1, 10), (2, 11)], [(3, 12), (4, 13), (5, 14)]],
+        )
+
+    def test_cada_ciclo_una_sola_vez(self):
+        # Triángulo en ambos sentidos: dos ciclos de 3 y tres de 2, sin rotaciones repetidas
+        aristas = []
+        for i, (u, v) in enumerate([(1, 2), (2, 3), (3, 1), (2, 1), (3, 2), (1, 3)]):
+            aristas.append((u, v, 100 + i))
+        ciclos = buscar_ciclos(grafo_de(aristas))
+        usuarios = [tuple(u for u, _ in ciclo) for ciclo in ciclos]
+        self.assertEqual(usuarios, [(1, 2), (1, 3), (2, 3), (1, 2, 3), (1, 3, 2)])
+        self.assertEqual(len(set(usuarios)), len(usuarios))
+
+    def test_respeta_el_limite_dentro_de_un_mismo_par(self):
+        # Todos los ciclos de 3 pasan por el par (1, 2): el límite debe cortar dentro del bucle interno
+        aristas = [(1, 2, 1)]
+        for w in range(3, 13):
+            aristas += [(2, w, w), (w, 1, 100 + w)]
+        ciclos = buscar_ciclos(grafo_de(aristas), limite=4)
+        self.assertEqual(len(ciclos), 4)
+
+    def test_sin_ciclos(self):
+        self.assertEqual(buscar_ciclos(grafo_de([(1, 2, 10), (2, 3, 11)])), [])
+
+
+class CiclosApiTests(APITestCase):
+
+    def setUp(self):
+        # Triángulo de intercambios: cada usuario pide el objeto del siguiente
+        self.localidad = Localidad.objects.create(nombre='Centro')
+        self.usuarios = [User.objects.create_user(f'usuario{i}') for i in range(3)]
+        objetos = [
+            Objeto.objects.create(
+                nombre=f'Objeto {i}', descripcion='-', propietario=u, localidad_actual=self.localidad,
+                disponible_para=Objeto.TipoDisponibilidad.INTERCAMBIO,
+            )
+            for i, u in enumerate(self.usuarios)
+        ]
+        self.solicitudes = [
+            SolicitudTransaccion.objects.create(
+                objeto=objetos[(i + 1) % 3], solicitante=u, tipo_transaccion=SolicitudTransaccion.TipoTransaccion.INTERCAMBIO,
+            )
+            for i, u in enumerate(self.usuarios)
+        ]
+        self.assertEqual(intercambios.recalcular_localidad(self.localidad.id), 1)
+        self.client.force_authenticate(self.usuarios[0])
+
+    def ciclos(self):
+        return self.client.get('/api/ciclos-intercambio/').json()['results']
+
+    def test_ciclo_completo(self):
+        ciclos = self.ciclos()
+        self.assertEqual(len(ciclos), 1)
+        self.assertEqual(ciclos[0]['tamano'], 3)
+
+    def test_oculta_ciclo_con_paso_no_pendiente(self):
+        solicitud = self.solicitudes[1]
+        solicitud.estado = Estado.RECHAZADA
+        solicitud.save()
+        self.assertEqual(self.ciclos(), [])
+
+    def test_oculta_ciclo_con_paso_borrado(self):
+        self.solicitudes[2].delete()
+        self.assertEqual(self.ciclos(), [])
+
+    def test_solo_ciclos_del_usuario(self):
+        self.client.force_authenticate(User.objects.create_user('ajeno'))
+        self.assertEqual(self.ciclos(), [])
+
+
+class InvalidarFacetasTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('propietario')
+        self.localidad = Localidad.objects.create(nombre='Centro')
+
+    def crear_objeto(self):
+        return Objeto.objects.create(nombre='Taladro', descripcion='-', propietario=self.usuario, localidad_actual=self.localidad)
+
+    def test_cambia_la_version_tras_el_commit(self):
+        version = facetas.version_actual()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_objeto()
+            self.assertEqual(facetas.version_actual(), version)
+        self.assertNotEqual(facetas.version_actual(), version)
+
+    @mock.patch('aplicacion.facetas.cache')
+    def test_caida_de_la_cache_no_falla_la_escritura(self, cache):
+        cache.set.side_effect = ConnectionError
+        with self.assertLogs('django', level='ERROR'):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.crear_objeto()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Objeto.objects.count(), 1)
+
+
+class ArchivoTests(APITestCase):
+
+    def setUp(self):
+        self.propietario = User.objects.create_user('propietario')
+        self.solicitante = User.objects.create_user('solicitante')
+        self.objeto = Objeto.objects.create(
+            nombre='Taladro', descripcion='-', propietario=self.propietario,
+            localidad_actual=Localidad.objects.create(nombre='Centro'),
+        )
+        self.hace_un_ano = timezone.now() - datetime.timedelta(days=365)
+
+    def solicitud(self, estado=Estado.COMPLETADA, antigua=True, **campos):
+        solicitud = SolicitudTransaccion.objects.create(
+            objeto=self.objeto, solicitante=self.solicitante, tipo_transaccion=SolicitudTransaccion.TipoTransaccion.PRESTAMO,
+            estado=estado, **campos
+        )
+        if antigua:
+            # fecha_solicitud es auto_now_add
+            SolicitudTransaccion.objects.filter(pk=solicitud.pk).update(fecha_solicitud=self.hace_un_ano)
+            solicitud.refresh_from_db()
+        return solicitud
+
+    def archivar(self):
+        return archivo.archivar_lote(archivo.fecha_limite())
+
+    def test_copia_la_fila_con_su_id(self):
+        solicitud = self.solicitud(mensaje_solicitud='Hola', fecha_fin_real=self.hace_un_ano, devuelto_confirmado=True)
+        self.assertEqual(self.archivar(), 1)
+        self.assertFalse(SolicitudTransaccion.objects.filter(pk=solicitud.pk).exists())
+        copia = SolicitudTransaccionArchivada.objects.get(pk=solicitud.pk)
+        for campo in SolicitudTransaccionArchivada._meta.concrete_fields:
+            self.assertEqual(getattr(copia, campo.attname), getattr(solicitud, campo.attname), campo.name)
+
+    def test_las_valoraciones_pasan_a_la_copia(self):
+        solicitud = self.solicitud()
+        valoracion = Valoracion.objects.create(
+            solicitud=solicitud, usuario_que_valora=self.solicitante, usuario_valorado=self.propietario, puntuacion=5
+        )
+        self.archivar()
+        valoracion.refresh_from_db()
+        self.assertIsNone(valoracion.solicitud_id)
+        self.assertEqual(valoracion.solicitud_archivada_id, solicitud.pk)
+
+    def test_no_toca_recientes_ni_abiertas(self):
+        reciente = self.solicitud(antigua=False)
+        cerrada_hace_poco = self.solicitud(fecha_fin_real=timezone.now())
+        pendiente = self.solicitud(estado=Estado.PENDIENTE)
+        en_curso = self.solicitud(estado=Estado.EN_CURSO)
+        self.assertEqual(self.archivar(), 0)
+        self.assertEqual(
+            set(SolicitudTransaccion.objects.values_list('pk', flat=True)),
+            {reciente.pk, cerrada_hace_poco.pk, pendiente.pk, en_curso.pk},
+        )
+        self.assertFalse(SolicitudTransaccionArchivada.objects.exists())
+
+    def test_por_lotes(self):
+        for _ in range(3):
+            self.solicitud()
+        self.assertEqual(archivo.archivar_lote(archivo.fecha_limite(), tamano=2), 2)
+        self.assertEqual(archivo.archivar_lote(archivo.fecha_limite(), tamano=2), 1)
+        self.assertEqual(self.archivar(), 0)
+
+    def test_detalle_de_solicitud_archivada(self):
+        solicitud = self.solicitud()
+        self.archivar()
+        url = f'/api/solicitudes/{solicitud.pk}/'
+        self.client.force_authenticate(self.propietario)
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['id'], solicitud.pk)
+        # Solo lectura y solo para los participantes
+        self.assertEqual(self.client.patch(url, {'mensaje_solicitud': 'x'}, format='json').status_code, 404)
+        self.client.force_authenticate(User.objects.create_user('ajeno'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_historial_pagina_sobre_ambas_tablas(self):
+        archivadas = [self.solicitud() for _ in range(6)]
+        self.archivar()
+        vivas = [self.solicitud(antigua=False) for _ in range(6)]
+        self.solicitud(estado=Estado.PENDIENTE, antigua=False) # No es historial
+        self.client.force_authenticate(self.solicitante)
+        primera = self.client.get('/api/solicitudes/historial/').json()
+        segunda = self.client.get('/api/solicitudes/historial/?page=2').json()
+        self.assertEqual(primera['count'], 12)
+        ids = [s['id'] for s in primera['results'] + segunda['results']]
+        # Las más recientes primero: las vivas y luego las archivadas, sin repetidas
+        esperados = [s.pk for s in reversed(vivas)] + [s.pk for s in reversed(archivadas)]
+        self.assertEqual(ids, esperados)
+
+    def test_listado_de_valoraciones_sin_consultas_por_fila(self):
+        self.client.force_authenticate(self.solicitante)
+
+        def consultas():
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.client.get('/api/valoraciones/')
+            self.assertEqual(respuesta.status_code, 200)
+            return len(capturadas)
+
+        def valorar():
+            solicitud = self.solicitud(objeto_ofrecido_intercambio=self.objeto)
+            Valoracion.objects.create(
+                solicitud=solicitud, usuario_que_valora=self.solicitante, usuario_valorado=self.propietario, puntuacion=4
+            )
+
+        valorar()
+        self.archivar()
+        valorar()
+        antes = consultas()
+        for _ in range(3):
+            valorar()
+        self.archivar()
+        valorar()
+        self.assertEqual(consultas(), antes)
+        detalles = [v['solicitud_detalle']['id'] for v in self.client.get('/api/valoraciones/').json()['results']]
+        self.assertEqual(len(detalles), 6)
+
+
+class VecinosLocalidadTests(SimpleTestCase):
+
+    def test_texto_y_categoria(self):
+        objetos = [
+            (1, 'Taladro percutor', 'taladro bosch', 5),
+            (2, 'Taladro inalámbrico', 'taladro makita', 5),
+            (3, 'Martillo', 'mango de madera', 5),
+            (4, 'Bicicleta', 'bici roja', None),
+        ]
+        vecinos = vecinos_localidad(objetos, k=2)
+        # El texto compartido puntúa más que solo la categoría; sin texto ni categoría en común no hay vecinos
+        self.assertEqual([j for j, _ in vecinos[1]], [2, 3])
+        self.assertEqual([j for j, _ in vecinos[3]], [1, 2])
+        self.assertNotIn(4, vecinos)
+
+    def test_objetivos(self):
+        objetos = [(1, 'Taladro', 'x', None), (2, 'Taladro', 'y', None), (3, 'Taladro', 'z', None)]
+        self.assertEqual(set(vecinos_localidad(objetos, objetivos={2})), {2})
+
+    def test_listas_del_indice_acotadas(self):
+        # Un término presente en todos los objetos no recorre más de max_lista entradas
+        objetos = [(i, 'Silla', f'modelo{i}', None) for i in range(30)]
+        datos = indexar(objetos, max_lista=10)
+        self.assertEqual(len(datos['indice']['silla']), 10)
+
+
+class ContribucionTests(SimpleTestCase):
+
+    def test_objeto_solo_cuenta_si_esta_activo(self):
+        self.assertEqual(contadores.contribucion_objeto(True, 7), Counter({(7, 'objetos_publicados'): 1}))
+        self.assertEqual(contadores.contribucion_objeto(False, 7), Counter())
+
+    def test_solicitud_pendiente_cuenta_al_propietario(self):
+        self.assertEqual(
+            contadores.contribucion_solicitud(1, Estado.PENDIENTE, 2, 3),
+            Counter({(3, 'solicitudes_recibidas_pendientes'): 1}),
+        )
+
+    def test_solicitud_en_curso_cuenta_a_ambos(self):
+        self.assertEqual(
+            contadores.contribucion_solicitud(1, Estado.EN_CURSO, 2, 3),
+            Counter({(2, 'prestamos_activos'): 1, (3, 'prestamos_activos'): 1}),
+        )
+
+    def test_solicitud_propia_cuenta_una_vez(self):
+        self.assertEqual(
+            contadores.contribucion_solicitud(1, Estado.EN_CURSO, 2, 2),
+            Counter({(2, 'prestamos_activos'): 1}),
+        )
+
+    def test_solicitud_completada_sin_quien_ya_valoro(self):
+        self.assertEqual(
+            contadores.contribucion_solicitud(1, Estado.COMPLETADA, 2, 3, ya_valoraron={2}),
+            Counter({(3, 'valoraciones_pendientes'): 1}),
+        )
+
+    def test_solicitud_rechazada_no_cuenta(self):
+        self.assertEqual(contadores.contribucion_solicitud(1, Estado.RECHAZADA, 2, 3), Counter())
+
+    def test_valoracion_de_solicitud_archivada_no_cuenta(self):
+        self.assertEqual(contadores.contribucion_valoracion(1, None, 2), Counter())
+
+
+class ContadoresMantenidosTests(TestCase):
+    """Cada escritura real debe dejar los contadores igual que un cálculo desde cero."""
 
     def setUp(self):
-        # Configura los datos necesarios para las pruebas
-        YourModel.objects.create(field1='value1', field2='value2')  # Ajusta los campos según tu modelo
-
-    def test_model_str(self):
-        # Prueba que el método __str__ de tu modelo funcione correctamente
-        model_instance = YourModel.objects.get(field1='value1')
-        self.assertEqual(str(model_instance), 'Expected String Representation')  # Ajusta según tu modelo
-
-    def test_model_field(self):
-        # Prueba que un campo específico tenga el valor esperado
-        model_instance = YourModel.objects.get(field1='value1')
-        self.assertEqual(model_instance.field2, 'value2')  # Ajusta según tu modelo
\ No newline at end of file
+        self.propietario = User.objects.create_user('propietario')
+        self.solicitante = User.objects.create_user('solicitante')
+        self.otro = User.objects.create_user('otro')
+        self.usuarios = [self.propietario, self.solicitante, self.otro]
+        for usuario in self.usuarios:
+            contadores.obtener(usuario.pk) # Crea las filas que luego se actualizan con F()
+        self.localidad = Localidad.objects.create(nombre='Centro')
+        self.objeto = self.crear_objeto()
+
+    def crear_objeto(self, propietario=None, **campos):
+        return Objeto.objects.create(
+            nombre='Taladro', descripcion='-', propietario=propietario or self.propietario,
+            localidad_actual=self.localidad, **campos
+        )
+
+    def crear_solicitud(self, objeto=None, solicitante=None, **campos):
+        return SolicitudTransaccion.objects.create(
+            objeto=objeto or self.objeto, solicitante=solicitante or self.solicitante,
+            tipo_transaccion=SolicitudTransaccion.TipoTransaccion.PRESTAMO, **campos
+        )
+
+    def valorar(self, solicitud, usuario_que_valora, usuario_valorado):
+        return Valoracion.objects.create(
+            solicitud=solicitud, usuario_que_valora=usuario_que_valora, usuario_valorado=usuario_valorado, puntuacion=4
+        )
+
+    def mantenidos(self):
+        return {
+            c.user_id: {campo: getattr(c, campo) for campo in contadores.CAMPOS}
+            for c in ContadoresUsuario.objects.filter(user__in=self.usuarios)
+        }
+
+    def comprobar(self):
+        self.assertEqual(self.mantenidos(), contadores.calcular([u.pk for u in self.usuarios]))
+
+    def cambiar_estado(self, solicitud, estado):
+        solicitud.estado = estado
+        solicitud.save()
+        self.comprobar()
+
+    def test_objetos(self):
+        inactivo = self.crear_objeto(activo=False)
+        self.comprobar()
+        inactivo.activo = True
+        inactivo.save()
+        self.comprobar()
+        self.objeto.propietario = self.otro
+        self.objeto.save()
+        self.comprobar()
+        self.objeto.delete()
+        self.comprobar()
+        self.assertEqual(self.mantenidos()[self.propietario.pk]['objetos_publicados'], 1)
+
+    def test_ciclo_de_vida_de_una_solicitud(self):
+        solicitud = self.crear_solicitud()
+        self.comprobar()
+        self.assertEqual(self.mantenidos()[self.propietario.pk]['solicitudes_recibidas_pendientes'], 1)
+        self.cambiar_estado(solicitud, Estado.EN_CURSO)
+        self.cambiar_estado(solicitud, Estado.COMPLETADA)
+        self.assertEqual(self.mantenidos()[self.solicitante.pk]['valoraciones_pendientes'], 1)
+        valoracion = self.valorar(solicitud, self.solicitante, self.propietario)
+        self.comprobar()
+        self.assertEqual(self.mantenidos()[self.solicitante.pk]['valoraciones_pendientes'], 0)
+        # Reabrirla y volver a completarla no cuenta dos veces
+        self.cambiar_estado(solicitud, Estado.DISPUTA)
+        self.cambiar_estado(solicitud, Estado.COMPLETADA)
+        valoracion.delete()
+        self.comprobar()
+        solicitud.delete()
+        self.comprobar()
+
+    def test_editar_una_valoracion(self):
+        primera = self.crear_solicitud(estado=Estado.COMPLETADA)
+        segunda = self.crear_solicitud(estado=Estado.COMPLETADA)
+        valoracion = self.valorar(primera, self.solicitante, self.propietario)
+        self.comprobar()
+        valoracion.solicitud = segunda
+        valoracion.save()
+        self.comprobar()
+        valoracion.usuario_que_valora, valoracion.usuario_valorado = self.propietario, self.solicitante
+        valoracion.save()
+        self.comprobar()
+        valoracion.puntuacion = 1
+        valoracion.save()
+        self.comprobar()
+
+    def test_borrados_en_cascada(self):
+        objeto = self.crear_objeto(propietario=self.otro)
+        self.crear_solicitud(objeto=objeto)
+        en_curso = self.crear_solicitud(objeto=objeto, estado=Estado.EN_CURSO)
+        completada = self.crear_solicitud(objeto=objeto, estado=Estado.COMPLETADA)
+        self.valorar(completada, self.otro, self.solicitante)
+        self.comprobar()
+        objeto.delete() # Se lleva sus solicitudes y valoraciones
+        self.comprobar()
+        self.assertFalse(SolicitudTransaccion.objects.filter(pk=en_curso.pk).exists())
+        completada = self.crear_solicitud(estado=Estado.COMPLETADA)
+        self.valorar(completada, self.propietario, self.solicitante)
+        self.solicitante.delete()
+        self.usuarios.remove(self.solicitante)
+        self.comprobar()
+
+    def test_archivar(self):
+        completadas = [self.crear_solicitud(estado=Estado.COMPLETADA) for _ in range(3)]
+        self.valorar(completadas[0], self.solicitante, self.propietario)
+        self.valorar(completadas[1], self.propietario, self.solicitante)
+        self.crear_solicitud(estado=Estado.RECHAZADA)
+        self.crear_solicitud()
+        SolicitudTransaccion.objects.update(fecha_solicitud=timezone.now() - datetime.timedelta(days=365))
+        self.assertEqual(archivo.archivar_lote(archivo.fecha_limite()), 4)
+        self.comprobar()
+
+    def test_recalcular_coincide_con_lo_mantenido(self):
+        solicitud = self.crear_solicitud(estado=Estado.COMPLETADA)
+        self.valorar(solicitud, self.propietario, self.solicitante)
+        self.crear_solicitud(solicitante=self.otro, estado=Estado.EN_CURSO)
+        self.crear_objeto(propietario=self.otro)
+        antes = self.mantenidos()
+        self.assertEqual(contadores.recalcular([u.pk for u in self.usuarios]), 3)
+        self.assertEqual(self.mantenidos(), antes)
+
+    def test_resumen_crea_la_fila_si_falta(self):
+        ContadoresUsuario.objects.filter(user=self.propietario).delete()
+        self.crear_solicitud() # Sin fila no se actualiza nada...
+        self.client.force_login(self.propietario)
+        respuesta = self.client.get('/api/perfiles/me/resumen/')
+        # ...y el resumen la calcula entera
+        self.assertEqual(respuesta.json()['solicitudes_recibidas_pendientes'], 1)
+        self.comprobar()
+
+
+@mock.patch('aplicacion.contadores.ContadoresUsuario')
+class AplicarTests(SimpleTestCase):
+
+    def test_una_actualizacion_por_usuario(self, modelo):
+        contadores.aplicar(Counter({
+            (1, 'objetos_publicados'): 1,
+            (1, 'prestamos_activos'): -1,
+            (2, 'valoraciones_pendientes'): 2,
+        }))
+        filtrar = modelo.objects.filter
+        self.assertEqual(filtrar.call_args_list, [mock.call(user_id=1), mock.call(user_id=2)])
+        self.assertEqual(filtrar.return_value.update.call_args_list, [
+            mock.call(objetos_publicados=F('objetos_publicados') + 1, prestamos_activos=F('prestamos_activos') + -1),
+            mock.call(valoraciones_pendientes=F('valoraciones_pendientes') + 2),
+        ])
+
+    def test_ignora_deltas_nulos(self, modelo):
+        deltas = Counter({(1, 'objetos_publicados'): 1})
+        deltas.subtract({(1, 'objetos_publicados'): 1})
+        contadores.aplicar(deltas)
+        modelo.objects.filter.assert_not_called()
+
+    def test_en_bloque_desactiva_los_receptores_por_fila(self, modelo):
+        self.assertTrue(contadores.por_fila())
+        with contadores.en_bloque():
+            self.assertFalse(contadores.por_fila())
+        self.assertTrue(contadores.por_fila())
+
+
+class BatchTests(APITestCase):
+    url = '/api/batch/'
+
+    def batch(self, *peticiones, **extra):
+        respuesta = self.client.post(self.url, {'peticiones': list(peticiones)}, format='json', **extra)
+        self.assertEqual(respuesta.status_code, 200)
+        return [(r['estado'], r['cuerpo']) for r in respuesta.json()['respuestas']]
+
+    def test_ruta_desconocida_y_batch_anidado(self):
+        estados = [estado for estado, _ in self.batch(
+            {'url': '/api/no-existe/'},
+            {'url': '/admin/'}, # Fuera de la API
+            {'metodo': 'POST', 'url': '/api/batch/', 'cuerpo': {'peticiones': [{'url': '/api/localidades/'}]}},
+            {'url': '/api/localidades/'},
+        )]
+        self.assertEqual(estados, [404, 404, 400, 200])
+
+    def test_un_error_solo_deshace_su_subpeticion(self):
+        def crear(vista, serializer):
+            serializer.save()
+            if serializer.instance.nombre == 'Falla':
+                raise RuntimeError
+
+        with mock.patch.object(LocalidadViewSet, 'perform_create', autospec=True, side_effect=crear):
+            with self.assertLogs('aplicacion.views', level='ERROR'):
+                resultados = self.batch(
+                    {'metodo': 'POST', 'url': '/api/localidades/', 'cuerpo': {'nombre': 'Antes'}},
+                    {'metodo': 'POST', 'url': '/api/localidades/', 'cuerpo': {'nombre': 'Falla'}},
+                    {'metodo': 'POST', 'url': '/api/localidades/', 'cuerpo': {'nombre': 'Despues'}},
+                    {'url': '/api/localidades/'},
+                    HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(User.objects.create_user("admin"))}',
+                )
+        self.assertEqual([estado for estado, _ in resultados], [201, 500, 201, 200])
+        self.assertEqual(set(Localidad.objects.values_list('nombre', flat=True)), {'Antes', 'Despues'})
+
+    def test_autentica_una_sola_vez(self):
+        usuario = User.objects.create_user('usuario')
+        token = AccessToken.for_user(usuario)
+        validar = mock.patch.object(
+            JWTAuthentication, 'get_validated_token', autospec=True, side_effect=JWTAuthentication.get_validated_token
+        )
+        with validar as validado:
+            resultados = self.batch(
+                {'url': '/api/solicitudes/'},
+                {'url': '/api/perfiles/me/resumen/'},
+                {'url': '/api/valoraciones/'},
+                HTTP_AUTHORIZATION=f'Bearer {token}',
+            )
+        self.assertEqual([estado for estado, _ in resultados], [200, 200, 200])
+        self.assertEqual(validado.call_count, 1)
+
+    def test_anonimo_en_ruta_protegida(self):
+        (protegida, _), (publica, _) = self.batch({'url': '/api/solicitudes/'}, {'url': '/api/localidades/'})
+        self.assertIn(protegida, (401, 403))
+        self.assertEqual(publica, 200)
@@ -11,11 +11,13 @@ router.register(r'objetos', views.ObjetoViewSet, basename='objeto')
 router.register(r'fotos', views.FotoObjetoViewSet, basename='fotoobjeto') # Considera si este es necesario o se maneja anidado
 router.register(r'solicitudes', views.SolicitudTransaccionViewSet, basename='solicitudtransaccion')
 router.register(r'valoraciones', views.ValoracionViewSet, basename='valoracion')
+router.register(r'ciclos-intercambio', views.CicloIntercambioViewSet, basename='ciclointercambio')
 
 # Las URLs de la API son determinadas automáticamente por el router.
 # También podemos añadir URLs para vistas basadas en funciones o clases que no sean ViewSets.
 urlpatterns = [
     path('', include(router.urls)),
+    path('batch/', views.BatchView.as_view(), name='batch'), # Varias peticiones a la API en una sola llamada
     # Aquí podrías añadir otras URLs específicas de la API de tu aplicación si las necesitas
     # path('mi-vista-personalizada/', views.mi_vista_api_personalizada, name='mi-vista-api'),
 ]
\ No newline at end of file
@@ -1,14 +1,21 @@
-from django.shortcuts import render
-from django.http import HttpResponse
-from rest_framework import viewsets, permissions
+from django.shortcuts import render, get_object_or_404
+from django.http import Http404, HttpResponse
+from rest_framework import viewsets, permissions, filters
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
+from . import contadores, facetas as facetas_objetos
 from .models import (
     Localidad,
     CategoriaObjeto,
     PerfilUsuario,
     Objeto,
+    ObjetoSimilar,
     FotoObjeto,
     SolicitudTransaccion,
+    SolicitudTransaccionArchivada,
+    CicloIntercambio,
     Valoracion
 )
 from .serializers import (
@@ -16,12 +23,25 @@ from .serializers import (
     CategoriaObjetoSerializer,
     UserSerializer, # Aunque no tengamos un UserViewSet aquí, otros serializers lo usan
     PerfilUsuarioSerializer,
+    ContadoresUsuarioSerializer,
     ObjetoSerializer,
+    ObjetoSimilarSerializer,
     FotoObjetoSerializer,
     SolicitudTransaccionSerializer,
-    ValoracionSerializer
+    CicloIntercambioSerializer,
+    ValoracionSerializer,
+    BatchSerializer
 )
 from django.contrib.auth.models import User
+import json
+import logging
+from io import BytesIO
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import models, transaction
+from django.urls import Resolver404, resolve
+from django.db.models import Prefetch
+
+logger = logging.getLogger(__name__)
 
 def home(request):
     return HttpResponse("¡Bienvenido a mi aplicación Django!")
@@ -46,6 +66,11 @@ class PerfilUsuarioViewSet(viewsets.ModelViewSet):
     serializer_class = PerfilUsuarioSerializer
     permission_classes = [permissions.IsAuthenticated] # Solo usuarios autenticados pueden ver/editar perfiles (podrías necesitar permisos más granulares)
 
+    @action(detail=False, methods=['get'], url_path='me/resumen')
+    def resumen(self, request):
+        # Contadores para el panel del usuario: una lectura por clave primaria (ver contadores.py)
+        return Response(ContadoresUsuarioSerializer(contadores.obtener(request.user.pk)).data)
+
     # Podrías querer filtrar para que un usuario solo vea/edite su propio perfil,
     # o añadir una acción para "mi perfil".
     # def get_queryset(self):
@@ -57,14 +82,29 @@ class PerfilUsuarioViewSet(viewsets.ModelViewSet):
 class ObjetoViewSet(viewsets.ModelViewSet):
     queryset = Objeto.objects.all()
     serializer_class = ObjetoSerializer
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['categoria', 'localidad_actual', 'disponible_para']
+    search_fields = ['nombre', 'descripcion'] # ?search=texto
     permission_classes = [permissions.IsAuthenticatedOrReadOnly] # Cualquiera puede ver, solo autenticados pueden crear/editar
+    lookup_value_regex = r'\d+' # Los ids son numéricos; evita errores al filtrar por pk en acciones como 'similares'
 
     def perform_create(self, serializer):
         # Asignar el propietario automáticamente al usuario autenticado al crear un objeto
         serializer.save(propietario=self.request.user)
 
+    @action(detail=True, methods=['get'])
+    def similares(self, request, pk=None):
+        # Lectura directa de los vecinos precalculados (comando calcular_similares), sin cargar el objeto
+        vecinos = ObjetoSimilar.objects.filter(objeto_id=pk, similar__activo=True).select_related('similar')
+        serializer = ObjetoSimilarSerializer(vecinos, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def facetas(self, request):
+        # Conteos por categoría, disponibilidad y localidad con los mismos filtros que el listado.
+        # Se cachean por combinación de filtros y se invalidan al guardar o borrar un Objeto (signals.py).
+        return Response(facetas_objetos.obtener(self, request))
+
     # Aquí podrías añadir filtros más avanzados (ej. por localidad, categoría, disponibilidad)
     # usando django-filter o implementando el método get_queryset.
 
@@ -93,6 +133,40 @@ class SolicitudTransaccionViewSet(viewsets.ModelViewSet):
         # Asignar el solicitante automáticamente al usuario autenticado
         serializer.save(solicitante=self.request.user)
 
+    def get_object(self):
+        # Las solicitudes archivadas (comando archivar_solicitudes) siguen siendo accesibles en modo lectura
+        try:
+            return super().get_object()
+        except Http404:
+            if self.request.method not in permissions.SAFE_METHODS:
+                raise
+        user = self.request.user
+        archivadas = SolicitudTransaccionArchivada.objects.filter(
+            models.Q(solicitante=user) | models.Q(objeto__propietario=user)
+        ).select_related('objeto__propietario', 'solicitante', 'objeto_ofrecido_intercambio')
+        solicitud = get_object_or_404(archivadas, pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        self.check_object_permissions(self.request, solicitud)
+        return solicitud
+
+    @action(detail=False, methods=['get'])
+    def historial(self, request):
+        # Solicitudes finalizadas del usuario, estén aún en la tabla principal o ya archivadas.
+        # Se pagina sobre (id, fecha) de ambas tablas y luego se cargan solo las de la página.
+        user = request.user
+        filtro = models.Q(solicitante=user) | models.Q(objeto__propietario=user)
+        vivas = SolicitudTransaccion.objects.filter(
+            filtro, estado__in=SolicitudTransaccion.ESTADOS_FINALES
+        ).order_by().values_list('id', 'fecha_solicitud')
+        archivadas = SolicitudTransaccionArchivada.objects.filter(filtro).order_by().values_list('id', 'fecha_solicitud')
+        pagina = self.paginate_queryset(vivas.union(archivadas, all=True).order_by('-fecha_solicitud', '-id'))
+
+        ids = [id_solicitud for id_solicitud, _ in pagina]
+        relacionados = ('objeto__propietario', 'solicitante', 'objeto_ofrecido_intercambio')
+        instancias = {s.id: s for s in SolicitudTransaccion.objects.filter(id__in=ids).select_related(*relacionados)}
+        instancias.update({s.id: s for s in SolicitudTransaccionArchivada.objects.filter(id__in=ids).select_related(*relacionados)})
+        serializer = self.get_serializer([instancias[i] for i in ids if i in instancias], many=True)
+        return self.get_paginated_response(serializer.data)
+
     # Aquí podrías añadir acciones personalizadas como "aceptar_solicitud", "rechazar_solicitud", etc.
     # @action(detail=True, methods=['post'])
     # def aceptar(self, request, pk=None):
@@ -102,6 +176,24 @@ class SolicitudTransaccionViewSet(viewsets.ModelViewSet):
     #     solicitud.save()
     #     return Response({'status': 'solicitud aceptada'})
 
+class CicloIntercambioViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = CicloIntercambioSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        # Solo los ciclos sugeridos (comando buscar_ciclos_intercambio) en los que participa el usuario y
+        # cuyos pasos siguen todos pendientes: al borrar o archivar una solicitud desaparece su enlace,
+        # así que se cuentan las pendientes y se comparan con el tamaño del ciclo
+        return CicloIntercambio.objects.filter(participantes=self.request.user).annotate(
+            pendientes=models.Count(
+                'solicitudes',
+                filter=models.Q(solicitudes__estado=SolicitudTransaccion.EstadoSolicitud.PENDIENTE),
+                distinct=True,
+            )
+        ).filter(pendientes=models.F('tamano')).order_by('tamano', '-fecha_creacion', 'id').prefetch_related(
+            Prefetch('solicitudes', queryset=SolicitudTransaccion.objects.select_related('objeto'))
+        )
+
 class ValoracionViewSet(viewsets.ModelViewSet):
     queryset = Valoracion.objects.all().select_related('solicitud', 'usuario_que_valora', 'usuario_valorado')
     serializer_class = ValoracionSerializer
@@ -109,15 +201,100 @@ class ValoracionViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        # Un usuario puede ver las valoraciones que ha emitido o recibido
+        # Un usuario puede ver las valoraciones que ha emitido o recibido.
+        # solicitud_detalle sale de la solicitud activa o de su copia archivada: se cargan las dos
+        # con todo lo que anida SolicitudTransaccionSerializer para no hacer consultas por fila
+        relacionados = [
+            f'{solicitud}__{campo}'
+            for solicitud in ('solicitud', 'solicitud_archivada')
+            for campo in (
+                'solicitante', 'objeto__propietario', 'objeto__categoria', 'objeto__localidad_actual',
+                'objeto_ofrecido_intercambio__propietario', 'objeto_ofrecido_intercambio__categoria',
+                'objeto_ofrecido_intercambio__localidad_actual',
+            )
+        ]
+        fotos = [
+            f'{solicitud}__{objeto}__fotos'
+            for solicitud in ('solicitud', 'solicitud_archivada')
+            for objeto in ('objeto', 'objeto_ofrecido_intercambio')
+        ]
         return Valoracion.objects.filter(
             models.Q(usuario_que_valora=user) | models.Q(usuario_valorado=user)
-        ).distinct()
+        ).distinct().select_related('usuario_que_valora', 'usuario_valorado', *relacionados).prefetch_related(*fotos)
 
     def perform_create(self, serializer):
         # Asignar el usuario_que_valora automáticamente al usuario autenticado
         serializer.save(usuario_que_valora=self.request.user)
 
+class BatchView(APIView):
+    """
+    Ejecuta varias peticiones a la API en una sola llamada:
+    POST /api/batch/ {"peticiones": [{"metodo": "GET", "url": "/api/localidades/"}, ...]}
+    La autenticación se resuelve una vez y cada subpetición se despacha en el mismo proceso
+    (sin middleware), en orden y sobre la misma conexión. Cada una va en su propio savepoint,
+    así que un error en una no deshace las demás.
+    """
+    permission_classes = [permissions.AllowAny] # Cada subpetición aplica los permisos de su vista
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        prefijo = request.path_info[:-len('batch/')] # "/api/"
+        respuestas = [self.despachar(request, peticion, prefijo) for peticion in serializer.validated_data['peticiones']]
+        return Response({'respuestas': respuestas})
+
+    def despachar(self, request, peticion, prefijo):
+        ruta, _, query = peticion['url'].partition('?')
+        try:
+            if not ruta.startswith(prefijo):
+                raise Resolver404
+            match = resolve('/' + ruta[len(prefijo):], urlconf='aplicacion.urls')
+        except Resolver404:
+            return {'url': peticion['url'], 'estado': 404, 'cuerpo': {'detail': 'Ruta no encontrada.'}}
+        if getattr(match.func, 'view_class', None) is BatchView:
+            return {'url': peticion['url'], 'estado': 400, 'cuerpo': {'detail': 'No se permiten batch anidados.'}}
+
+        subpeticion = self.construir_subpeticion(request, peticion, ruta, query)
+        subpeticion.resolver_match = match
+        try:
+            with transaction.atomic():
+                respuesta = match.func(subpeticion, *match.args, **match.kwargs)
+        except Exception:
+            logger.exception("Error en la subpetición batch %s %s", peticion['metodo'], peticion['url'])
+            return {'url': peticion['url'], 'estado': 500, 'cuerpo': {'detail': 'Error interno.'}}
+
+        if hasattr(respuesta, 'data'):
+            cuerpo = respuesta.data # Sin renderizar: se serializa una sola vez, con la respuesta del batch
+        else:
+            contenido = respuesta.content.decode(respuesta.charset or 'utf-8')
+            cuerpo = json.loads(contenido) if respuesta.get('Content-Type', '').startswith('application/json') else contenido
+        return {'url': peticion['url'], 'estado': respuesta.status_code, 'cuerpo': cuerpo}
+
+    def construir_subpeticion(self, request, peticion, ruta, query):
+        contenido = json.dumps(peticion['cuerpo']).encode() if peticion.get('cuerpo') is not None else b''
+        environ = {
+            clave: valor for clave, valor in request.META.items()
+            if not clave.startswith('wsgi.') and clave not in ('CONTENT_TYPE', 'CONTENT_LENGTH')
+        }
+        environ.update({
+            'REQUEST_METHOD': peticion['metodo'],
+            'PATH_INFO': ruta,
+            'QUERY_STRING': query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(contenido)),
+            'wsgi.input': BytesIO(contenido),
+            'wsgi.url_scheme': request.scheme,
+        })
+        subpeticion = WSGIRequest(environ)
+        # Reutiliza el usuario ya autenticado (DRF no vuelve a decodificar el JWT) y la sesión
+        subpeticion.user = request.user
+        if hasattr(request._request, 'session'):
+            subpeticion.session = request._request.session
+        if request.user.is_authenticated:
+            subpeticion._force_auth_user = request.user
+            subpeticion._force_auth_token = request.auth
+        return subpeticion
+
 # No creamos un UserViewSet aquí porque DRF no lo proporciona por defecto de forma segura
 # para la creación/gestión de usuarios (especialmente contraseñas).
 # La creación de usuarios se suele manejar con librerías como djoser o django-rest-auth,
@@ -76,6 +76,7 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', ''),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        'ATOMIC_REQUESTS': True,  # Cada petición en una transacción (p. ej. escrituras + contadores de aplicacion/signals.py)
     }
 }
 
@@ -159,6 +160,37 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,  # Número de resultados por página
 }
 
+# Recomendador de objetos similares (comando calcular_similares)
+OBJETOS_SIMILARES_TOP_K = 10  # Vecinos guardados por objeto
+OBJETOS_SIMILARES_MAX_DF = 0.5  # Se ignoran términos presentes en más de esta fracción de objetos de la localidad
+OBJETOS_SIMILARES_MIN_OBJETOS_MAX_DF = 50  # ...pero solo en localidades con al menos este número de objetos
+OBJETOS_SIMILARES_MAX_LISTA = 100  # Objetos recorridos como máximo por término al buscar candidatos
+
+# Caché compartida por todos los procesos: la invalidación de /api/objetos/facetas/ depende de ello
+# (con la LocMemCache por defecto cada worker tendría su propia copia).
+# Con REDIS_URL se usa Redis (requiere el paquete redis); si no, una tabla en la base de datos,
+# que hay que crear una vez con: python manage.py createcachetable
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_barrioapi',
+        }
+    }
+
+# Segundos que se cachean los conteos de /api/objetos/facetas/ (también se invalidan al modificar objetos)
+FACETAS_OBJETOS_TIMEOUT = 300
+
+# Días desde su cierre tras los que una solicitud finalizada se mueve al archivo (comando archivar_solicitudes)
+SOLICITUDES_ARCHIVO_DIAS = 180
+
 # (Opcional) Configuración específica de Simple JWT (puedes añadirla más tarde si necesitas personalizar)
 # from datetime import timedelta
 # SIMPLE_JWT = {